@@ -1,11 +1,11 @@
 import streamlit as st
 import asyncio
+import json
 import tempfile
 import subprocess
 import sys
 import os
 from pathlib import Path
-from core import convert_presentation
 
 st.set_page_config(page_title="Web Slides a PDF", page_icon="📄", layout="centered")
 
@@ -13,14 +13,66 @@ if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 
+# Navegadores que instala `playwright install chromium` (headless usa el shell)
+CHROMIUM_BROWSERS = ("chromium", "chromium-headless-shell")
+
+
+def _chromium_installed():
+    """Comprueba en disco si Playwright ya descargó Chromium, sin lanzar procesos."""
+    browsers_path = os.environ.get("PLAYWRIGHT_BROWSERS_PATH")
+    if browsers_path == "0":
+        # Navegadores dentro del paquete: no hay caché que revisar
+        return False
+    if browsers_path:
+        cache = Path(browsers_path)
+    elif sys.platform == "win32":
+        cache = Path(os.environ.get("LOCALAPPDATA", Path.home())) / "ms-playwright"
+    elif sys.platform == "darwin":
+        cache = Path.home() / "Library" / "Caches" / "ms-playwright"
+    else:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+        cache = Path(xdg_cache) / "ms-playwright"
+
+    # Revisiones que espera la versión instalada de Playwright: tras una
+    # actualización, las carpetas de la revisión anterior no sirven
+    import playwright
+
+    browsers_json = Path(playwright.__file__).parent / "driver/package/browsers.json"
+    try:
+        browsers = json.loads(browsers_json.read_text())["browsers"]
+    except (OSError, ValueError, KeyError):
+        return False
+    expected = {b["name"]: b for b in browsers if b["name"] in CHROMIUM_BROWSERS}
+    if len(expected) != len(CHROMIUM_BROWSERS):
+        return False
+
+    for name, browser in expected.items():
+        # Revisiones por plataforma: que decida el instalador
+        if browser.get("revisionOverrides"):
+            return False
+        # Playwright deja INSTALLATION_COMPLETE al terminar cada descarga
+        folder = f"{name.replace('-', '_')}-{browser['revision']}"
+        if not (cache / folder / "INSTALLATION_COMPLETE").exists():
+            return False
+    return True
+
+
 @st.cache_resource
 def ensure_playwright_installed():
-    """Instala los binarios de Playwright (Chromium)."""
+    """Instala los binarios de Playwright (Chromium) si aún no están en disco."""
+    if _chromium_installed():
+        return
+    # Se llama directo al driver de Playwright (Node) en vez de arrancar otro
+    # intérprete de Python con `python -m playwright`
+    from playwright._impl._driver import compute_driver_executable, get_driver_env
+
     try:
         subprocess.run(
-            [sys.executable, "-m", "playwright", "install", "chromium"],
+            [*compute_driver_executable(), "install", "chromium"],
+            env=get_driver_env(),
             check=True,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
         )
         print("✅ Navegador Chromium verificado/instalado.")
     except subprocess.CalledProcessError as e:
@@ -51,11 +103,22 @@ with col1:
         min_value=1,
         max_value=8,
         value=4,
-        help="Aumenta la resolución. Mayor calidad = archivo más pesado y proceso más lento.",
+        help="Aumenta la resolución. Mayor calidad = archivo más pesado y proceso más lento. Desde 7 las capturas son sin pérdida (PNG).",
+    )
+with col2:
+    target_dpi = st.selectbox(
+        "Resolución del PDF",
+        options=[None, 300, 150, 96],
+        format_func=lambda dpi: "Igual a la captura" if dpi is None else f"{dpi} DPI",
+        help="Reduce las imágenes al guardarlas: el texto se sigue renderizando con la calidad elegida, pero el PDF pesa menos.",
     )
 
 if uploaded_file is not None:
     if st.button("Convertir a PDF", type="primary"):
+        # Playwright se importa recién al convertir: los reruns de Streamlit
+        # que sólo redibujan la página no pagan su carga
+        from core import convert_presentation
+
         progress_bar = st.progress(0)
         status_text = st.empty()
 
@@ -76,7 +139,9 @@ if uploaded_file is not None:
 
             try:
                 asyncio.run(
-                    convert_presentation(input_path, output_path, quality, web_progress)
+                    convert_presentation(
+                        input_path, output_path, quality, web_progress, target_dpi
+                    )
                 )
 
                 progress_bar.progress(1.0)
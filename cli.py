@@ -3,7 +3,14 @@ import asyncio
 import argparse
 import sys
 from pathlib import Path
-from core import convert_presentation
+
+
+def positive_int(value):
+    """Tipo de argparse para enteros mayores que cero."""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"debe ser un entero positivo: {value}")
+    return number
 
 
 def cli_progress(current, total, message):
@@ -17,7 +24,45 @@ def cli_progress(current, total, message):
     sys.stdout.flush()
 
 
-async def process_files(paths, quality):
+async def convert_file(pool, input_file, quality, target_dpi=None, live=True):
+    """Convierte un archivo con un navegador del pool e informa el resultado.
+
+    Con `live` muestra la barra de progreso en una sola línea; si no (varios
+    archivos a la vez), imprime una línea por etapa para no mezclar salidas.
+    """
+    from core import convert_presentation_with_browser
+
+    output_pdf = input_file.with_suffix(".pdf")
+    name = input_file.name
+
+    def line_progress(current, total, message):
+        # Sólo los cambios de etapa; cada captura sería una línea por paso
+        if total == 0 or current == total:
+            print(f"   ℹ️  {name}: {message}")
+
+    try:
+        async with pool.browser() as browser:
+            print(f"📄 Procesando: {name}")
+            await convert_presentation_with_browser(
+                browser,
+                input_file,
+                output_pdf,
+                quality,
+                cli_progress if live else line_progress,
+                target_dpi,
+            )
+        result = f"   ✅ Guardado exitosamente: {output_pdf.name}"
+    except Exception as e:
+        result = f"   ❌ Error al convertir {name}: {e}"
+
+    if live:
+        print(f"\n{result}")
+        print("-" * 40)
+    else:
+        print(result)
+
+
+async def process_files(paths, quality, jobs=1, target_dpi=None):
     """Busca archivos SVG/HTML en las rutas dadas y ejecuta la conversión."""
     files_to_process = []
     valid_exts = {".svg", ".html"}
@@ -36,18 +81,25 @@ async def process_files(paths, quality):
         print("❌ No se encontraron archivos válidos (.svg, .html) en las rutas.")
         return
 
-    print(f"🚀 Procesando {len(files_to_process)} archivos (Calidad: {quality}x)\n")
+    print(
+        f"🚀 Procesando {len(files_to_process)} archivos "
+        f"(Calidad: {quality}x, Simultáneos: {jobs})\n"
+    )
 
-    for input_file in files_to_process:
-        output_pdf = input_file.with_suffix(".pdf")
-        print(f"📄 Procesando: {input_file.name}")
+    # Playwright se importa sólo si hay algo que convertir (no para --help)
+    from playwright.async_api import async_playwright
+    from core import BrowserPool
 
-        try:
-            await convert_presentation(input_file, output_pdf, quality, cli_progress)
-            print(f"\n   ✅ Guardado exitosamente: {output_pdf.name}")
-        except Exception as e:
-            print(f"\n   ❌ Error al convertir {input_file.name}: {e}")
-        print("-" * 40)
+    # Un navegador por archivo simultáneo, lanzados una sola vez para todo el lote
+    async with async_playwright() as p:
+        size = min(jobs, len(files_to_process))
+        async with BrowserPool(p, size=size) as pool:
+            await asyncio.gather(
+                *[
+                    convert_file(pool, f, quality, target_dpi, live=size == 1)
+                    for f in files_to_process
+                ]
+            )
 
 
 def main():
@@ -61,7 +113,22 @@ def main():
         type=int,
         default=4,
         choices=range(1, 9),
-        help="Factor de escala de calidad (1-8, defecto: 4)",
+        help="Factor de escala de calidad (1-8, defecto: 4; desde 7 sin pérdida)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        choices=range(1, 5),
+        help="Archivos a convertir en simultáneo (1-4, defecto: 1)",
+    )
+    parser.add_argument(
+        "--target-dpi",
+        type=positive_int,
+        default=None,
+        help="Resolución máxima de las imágenes del PDF, p. ej. 150 "
+        "(defecto: la de captura, 96 × calidad)",
     )
 
     args = parser.parse_args()
@@ -71,7 +138,7 @@ def main():
         sys.exit(0)
 
     try:
-        asyncio.run(process_files(args.paths, args.quality))
+        asyncio.run(process_files(args.paths, args.quality, args.jobs, args.target_dpi))
     except KeyboardInterrupt:
         print("\n\n⚠️  Proceso interrumpido por el usuario.")
         sys.exit(0)
@@ -1,23 +1,63 @@
 import asyncio
-import img2pdf
+import base64
+import heapq
+import os
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from io import BytesIO
 from pathlib import Path
 from playwright.async_api import async_playwright
+from pdf import PdfWriter, prepare_image
 
+# Extra opcional "optimize": recompresión sin pérdida de las capturas
+try:
+    import oxipng
+except ImportError:
+    oxipng = None
+try:
+    import mozjpeg_lossless_optimization
+except ImportError:
+    mozjpeg_lossless_optimization = None
+
+# Espera máxima (s) a que termine la animación de un paso
 TRANSITION_DELAY = 0.6
+# DPI de una captura a escala 1 (1 px CSS = 1/96 de pulgada)
+CSS_DPI = 96
+# Desde esta calidad se captura en PNG (sin pérdida); por debajo, en JPEG
+PNG_MIN_QUALITY = 7
+JPEG_QUALITY = 85
+# Chromium serializa las capturas por navegador: más páginas no aceleran
+MAX_PARALLEL_PAGES = 3
+# Conversiones tras las que se reinicia un navegador del pool
+BROWSER_RECYCLE_AFTER = 100
+# Capturas fuera de orden que se guardan en memoria; las demás esperan en disco
+IN_MEMORY_FRAMES = 64
+# Hilos para el trabajo de CPU y disco del PDF, fuera del event loop
+_pdf_exec = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+
+SOZI_HIDE_UI_CSS = ".sozi-frame-list, .sozi-frame-number { display: none !important; }"
 
 
 async def _analyze_presentation(page):
-    """Inyecta JS para detectar tipo de presentación (Sozi/JessyInk) y metadatos."""
+    """Inyecta JS para detectar tipo de presentación (Sozi/JessyInk) y metadatos.
+
+    `steps` trae ya los hashes URL de cada paso, armados en el navegador.
+
+    En Sozi además oculta su UI, para que no salga en el PDF, en el mismo viaje.
+    """
     return await page.evaluate(
-        """() => {
+        """(hideUiCss) => {
         // Detección Sozi
         if (typeof sozi !== 'undefined' && sozi.presentation) {
+            const style = document.createElement('style');
+            style.textContent = hideUiCss;
+            (document.head || document.documentElement).appendChild(style);
             return {
                 type: 'sozi',
                 width: window.innerWidth || 1024,
                 height: window.innerHeight || 768,
-                data: sozi.presentation.frames.map(f => f.frameId)
+                steps: sozi.presentation.frames.map(f => '#' + f.frameId)
             };
         }
         // Detección JessyInk
@@ -26,88 +66,371 @@ async def _analyze_presentation(page):
                 type: 'jessyink',
                 width: window.WIDTH || 1024,
                 height: window.HEIGHT || 768,
-                data: Array.from(slides).map(s => s.effects ? s.effects.length : 0)
+                // Un paso por efecto más el inicial; JessyInk usa base-1 para slides
+                steps: Array.from(slides).flatMap((s, i) =>
+                    Array.from(
+                        { length: (s.effects ? s.effects.length : 0) + 1 },
+                        (_, e) => '#' + (i + 1) + '_' + e
+                    )
+                )
             };
         }
         return { type: 'unknown' };
-    }"""
+    }""",
+        SOZI_HIDE_UI_CSS,
     )
 
 
-def _generate_steps(info):
-    """Genera la lista de hashes URL basada en el tipo de presentación."""
-    steps = []
-    if info["type"] == "sozi":
-        steps = [f"#{frame_id}" for frame_id in info["data"]]
-    elif info["type"] == "jessyink":
-        for slide_idx, effect_count in enumerate(info["data"]):
-            # JessyInk usa base-1 para slides
-            for effect_step in range(effect_count + 1):
-                steps.append(f"#{slide_idx + 1}_{effect_step}")
-    return steps
+async def _wait_for_settle(page, presentation_type):
+    """Espera a que la animación del paso actual termine (o a TRANSITION_DELAY)."""
+    await page.evaluate(
+        """([type, maxDelay]) => new Promise(resolve => {
+        // Dos frames seguidos sin animación pendiente: el estado es el final
+        const settle = () => requestAnimationFrame(() => requestAnimationFrame(resolve));
+        setTimeout(resolve, maxDelay);
+        if (type === 'sozi' && sozi.player && sozi.player.playing) {
+            sozi.player.addListener('frameChange', settle);
+        } else if (type === 'jessyink' && typeof processingEffect !== 'undefined') {
+            // JessyInk activa processingEffect mientras ejecuta un efecto
+            const poll = () => processingEffect ? setTimeout(poll, 16) : settle();
+            poll();
+        } else {
+            settle();
+        }
+    })""",
+        [presentation_type, TRANSITION_DELAY * 1000],
+    )
 
 
-async def convert_presentation(
-    file_path: Path, output_path: Path, quality: int, progress_callback=None
-):
-    """Convierte presentaciones web (SVG/HTML) a PDF."""
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(device_scale_factor=quality)
-        page = await context.new_page()
-        file_url = file_path.absolute().as_uri()
+async def _show_step(page, step_hash):
+    """Lleva la presentación ya cargada al paso indicado, sin volver a navegar."""
+    await page.evaluate(
+        """(hash) => {
+        const id = hash.slice(1);
+        if (typeof sozi !== 'undefined' && sozi.player) {
+            sozi.player.jumpToFrame(sozi.presentation.frames.find(f => f.frameId === id));
+            return;
+        }
+        // JessyInk: "#slide_efecto", con slides en base-1
+        const [slide, effect] = id.split('_').map(Number);
+        slideSetActiveSlide(slide - 1);
+        for (let e = 0; e < effect; e++) skipEffects(1);
+    }""",
+        step_hash,
+    )
+
+
+async def _screenshot(cdp, image_format):
+    """Captura el viewport por CDP, pidiendo a Chromium el codificador más rápido."""
+    params = {
+        "format": image_format,
+        "fromSurface": True,
+        "captureBeyondViewport": False,
+        "optimizeForSpeed": True,
+    }
+    if image_format == "jpeg":
+        params["quality"] = JPEG_QUALITY
+    result = await cdp.send("Page.captureScreenshot", params)
+    return base64.b64decode(result["data"])
+
+
+async def _capture_worker(queue, context, file_url, info, image_format, on_captured):
+    """Carga la presentación una sola vez y captura los pasos que toma de la cola.
+
+    La página y su sesión CDP quedan abiertas: se cierran junto con el
+    contexto compartido.
+    """
+    page = await context.new_page()
+    # Una sola sesión CDP por página, reutilizada en todas sus capturas
+    cdp = await context.new_cdp_session(page)
+    # Se espera sólo al evento load (no a networkidle, que cuesta al menos
+    # 500 ms); si el motor aún no se inicializó, se espera a la red y se reintenta
+    await page.goto(file_url, wait_until="load")
+    page_info = await _analyze_presentation(page)
+    if page_info["type"] != info["type"]:
+        await page.wait_for_load_state("networkidle")
+        page_info = await _analyze_presentation(page)
+    if page_info["type"] != info["type"]:
+        raise RuntimeError(
+            f"La presentación no se inicializó en la página de captura "
+            f"(se esperaba {info['type']}, se detectó {page_info['type']})."
+        )
+
+    while not queue.empty():
+        idx, step_hash = queue.get_nowait()
+        await _show_step(page, step_hash)
+        await _wait_for_settle(page, info["type"])
+
+        await on_captured(idx, await _screenshot(cdp, image_format))
+
+
+def _downscale(image, max_size):
+    """Reduce la captura para que quepa en `max_size` px, en su mismo formato."""
+    from PIL import Image
+
+    with Image.open(BytesIO(image)) as im:
+        if im.width <= max_size[0] and im.height <= max_size[1]:
+            return image
+        image_format = im.format
+        resized = im.convert("RGB")
+    resized.thumbnail(max_size, Image.LANCZOS)
+
+    out = BytesIO()
+    if image_format == "JPEG":
+        resized.save(
+            out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True
+        )
+    else:
+        resized.save(out, "PNG")
+    return out.getvalue()
+
+
+def _optimize(image):
+    """Recomprime la captura sin pérdida si el extra "optimize" está instalado."""
+    if oxipng and image.startswith(b"\x89PNG"):
+        return oxipng.optimize_from_memory(image, level=2)
+    if mozjpeg_lossless_optimization and image.startswith(b"\xff\xd8"):
+        return mozjpeg_lossless_optimization.optimize(image)
+    return image
+
+
+def _prepare(image, max_size):
+    """Prepara una captura para el PDF, reduciéndola antes si hace falta."""
+    if max_size:
+        image = _downscale(image, max_size)
+    return prepare_image(_optimize(image))
+
+
+def _prepare_spilled(spill_path, max_size):
+    """Lee una captura guardada en disco, la borra y la prepara para el PDF."""
+    image = spill_path.read_bytes()
+    spill_path.unlink()
+    return _prepare(image, max_size)
+
+
+async def _write_pages(results, total, writer, page_width, page_height, max_size=None):
+    """Añade al PDF las `total` capturas en orden, a medida que llegan de la cola."""
+    loop = asyncio.get_running_loop()
+
+    def run(fn, *args):
+        return loop.run_in_executor(_pdf_exec, fn, *args)
 
+    async def run_to_end(fn, *args):
+        # Si la tarea se cancela, espera igual a que el hilo termine: no puede
+        # quedar escribiendo en el archivo después de que se cierre
+        future = run(fn, *args)
         try:
-            if progress_callback:
-                progress_callback(0, 0, "Cargando presentación...")
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait({future})
+            raise
 
-            await page.goto(file_url)
-            await page.wait_for_load_state("networkidle")
+    pending = []  # Heap de (idx, imagen en preparación o ruta) aún sin escribir
+    next_idx = 0
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            while next_idx < total:
+                idx, image = await results.get()
+                # Acota la memoria si un paso lento retiene a todos los siguientes
+                if len(pending) >= IN_MEMORY_FRAMES:
+                    spill_path = Path(tmp_dir) / f"{idx:04d}"
+                    await run_to_end(spill_path.write_bytes, image)
+                    heapq.heappush(pending, (idx, spill_path))
+                else:
+                    # Se prepara ya, en paralelo con las capturas que siguen
+                    heapq.heappush(pending, (idx, run(_prepare, image, max_size)))
 
-            info = await _analyze_presentation(page)
-            if info["type"] == "unknown":
-                raise ValueError(
-                    "No es una presentación compatible (se requiere JessyInk o Sozi)."
-                )
+                while pending and pending[0][0] == next_idx:
+                    _, prepared = heapq.heappop(pending)
+                    if isinstance(prepared, Path):
+                        prepared = run(_prepare_spilled, prepared, max_size)
+                    prepared = await prepared
+                    await run_to_end(writer.add_page, prepared, page_width, page_height)
+                    next_idx += 1
+        await run_to_end(writer.close)
+    finally:
+        for _, prepared in pending:
+            if isinstance(prepared, asyncio.Future):
+                prepared.cancel()
 
-            # Ocultar UI específica de Sozi para que no salga en el PDF
-            if info["type"] == "sozi":
-                await page.add_style_tag(
-                    content=".sozi-frame-list, .sozi-frame-number { display: none !important; }"
-                )
 
-            await page.set_viewport_size(
-                {"width": int(info["width"]), "height": int(info["height"])}
-            )
+async def convert_presentation_with_browser(
+    browser,
+    file_path: Path,
+    output_path: Path,
+    quality: int,
+    progress_callback=None,
+    target_dpi: int | None = None,
+):
+    """Convierte una presentación a PDF usando un navegador ya abierto.
+
+    `quality` es la escala a la que se renderiza; `target_dpi`, si es menor,
+    limita la resolución con la que las imágenes se guardan en el PDF.
+    """
+    if target_dpi is not None and target_dpi <= 0:
+        raise ValueError(f"target_dpi debe ser positivo (recibido: {target_dpi}).")
+
+    file_url = file_path.absolute().as_uri()
+
+    if progress_callback:
+        progress_callback(0, 0, "Cargando presentación...")
+
+    probe_context = await browser.new_context()
+    try:
+        page = await probe_context.new_page()
+        await page.goto(file_url, wait_until="networkidle")
+        info = await _analyze_presentation(page)
+    finally:
+        await probe_context.close()
+
+    if info["type"] == "unknown":
+        raise ValueError(
+            "No es una presentación compatible (se requiere JessyInk o Sozi)."
+        )
 
-            steps = _generate_steps(info)
-            total = len(steps)
-            image_files = []
+    steps = info["steps"]
+    total = len(steps)
+    if not steps:
+        raise RuntimeError("No se generaron imágenes.")
 
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                for idx, step_hash in enumerate(steps):
-                    current = idx + 1
-                    if progress_callback:
-                        progress_callback(
-                            current, total, f"Capturando {current}/{total}"
-                        )
+    image_format = "png" if quality >= PNG_MIN_QUALITY else "jpeg"
+    # Página del tamaño del viewport en puntos (96 px CSS = 72 pt),
+    # independiente del factor de escala
+    page_width = info["width"] * 72 / CSS_DPI
+    page_height = info["height"] * 72 / CSS_DPI
+    max_size = None
+    if target_dpi is not None and target_dpi < CSS_DPI * quality:
+        # Al menos 1 px por lado, aunque el DPI pedido sea minúsculo
+        max_size = (
+            max(1, round(info["width"] * target_dpi / CSS_DPI)),
+            max(1, round(info["height"] * target_dpi / CSS_DPI)),
+        )
 
-                    await page.goto(f"{file_url}{step_hash}")
-                    await page.reload()  # Forzar estado final de animación
-                    await asyncio.sleep(TRANSITION_DELAY)
+    queue = asyncio.Queue()
+    for idx, step_hash in enumerate(steps):
+        queue.put_nowait((idx, step_hash))
+    # Acotada: si el PDF se atrasa, las páginas esperan antes de seguir capturando
+    results = asyncio.Queue(maxsize=IN_MEMORY_FRAMES)
+    captured = 0
 
-                    img_path = Path(tmp_dir) / f"{current:04d}.png"
-                    await page.screenshot(path=img_path, type="png")
-                    image_files.append(img_path)
+    async def on_captured(idx, image):
+        nonlocal captured
+        await results.put((idx, image))
+        captured += 1
+        if progress_callback:
+            progress_callback(captured, total, f"Capturando {captured}/{total}")
+
+    # Un único contexto para todas las páginas de captura: comparten caché y
+    # configuración, y cerrarlo libera todas las páginas de una vez
+    context = await browser.new_context(
+        device_scale_factor=quality,
+        viewport={"width": int(info["width"]), "height": int(info["height"])},
+    )
+    # Se escribe aparte para no pisar un PDF anterior si la conversión falla
+    partial_path = output_path.with_name(f"{output_path.name}.part")
+    try:
+        with open(partial_path, "wb") as f:
+            # El PDF se va escribiendo mientras las páginas siguen capturando
+            writer = asyncio.create_task(
+                _write_pages(
+                    results, total, PdfWriter(f), page_width, page_height, max_size
+                )
+            )
+            # Cada página navega una vez y reparte los pasos con las demás
+            workers = [
+                asyncio.create_task(
+                    _capture_worker(
+                        queue, context, file_url, info, image_format, on_captured
+                    )
+                )
+                for _ in range(min(MAX_PARALLEL_PAGES, total))
+            ]
+            capture = asyncio.gather(*workers)
+            try:
+                # Si el PDF falla nadie vuelve a leer `results` y las páginas
+                # quedarían bloqueadas: se corta al terminar la captura o ante
+                # el primer error de cualquiera
+                await asyncio.wait(
+                    {capture, writer}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if writer.done():
+                    writer.result()
+                await capture
 
                 if progress_callback:
                     progress_callback(total, total, "Generando PDF...")
 
-                if not image_files:
-                    raise RuntimeError("No se generaron imágenes.")
+                await writer
+            finally:
+                # Cancelar `capture` no alcanza a las páginas si ya terminó por
+                # el error de una de ellas: se cancelan una por una
+                tasks = [capture, writer, *workers]
+                for task in tasks:
+                    task.cancel()
+                # El escritor termina su escritura en curso antes de cerrar `f`
+                await asyncio.wait(tasks)
+                for task in tasks:
+                    if not task.cancelled():
+                        task.exception()  # Ya propagado (o sin error)
+        partial_path.replace(output_path)
+    finally:
+        await context.close()
+        partial_path.unlink(missing_ok=True)
 
-                with open(output_path, "wb") as f:
-                    f.write(img2pdf.convert([str(p) for p in image_files]))
 
+async def convert_presentation(
+    file_path: Path,
+    output_path: Path,
+    quality: int,
+    progress_callback=None,
+    target_dpi: int | None = None,
+):
+    """Convierte presentaciones web (SVG/HTML) a PDF."""
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        try:
+            await convert_presentation_with_browser(
+                browser, file_path, output_path, quality, progress_callback, target_dpi
+            )
         finally:
             await browser.close()
+
+
+class BrowserPool:
+    """Navegadores Chromium abiertos para reutilizar entre varias conversiones.
+
+    Cada navegador se reinicia tras `recycle_after` conversiones (o si se
+    desconectó) para que no acumule memoria a lo largo de un lote grande.
+    """
+
+    def __init__(self, playwright, size=1, recycle_after=BROWSER_RECYCLE_AFTER):
+        self._playwright = playwright
+        self._size = size
+        self._recycle_after = recycle_after
+        self._idle = asyncio.Queue()
+
+    async def __aenter__(self):
+        for _ in range(self._size):
+            self._idle.put_nowait([await self._launch(), 0])
+        return self
+
+    async def __aexit__(self, *exc_info):
+        while not self._idle.empty():
+            browser, _ = self._idle.get_nowait()
+            await browser.close()
+
+    async def _launch(self):
+        return await self._playwright.chromium.launch(headless=True)
+
+    @asynccontextmanager
+    async def browser(self):
+        """Presta un navegador libre, esperando si todos están ocupados."""
+        entry = await self._idle.get()
+        try:
+            if entry[1] >= self._recycle_after or not entry[0].is_connected():
+                await entry[0].close()
+                entry[:] = [await self._launch(), 0]
+            entry[1] += 1
+            yield entry[0]
+        finally:
+            self._idle.put_nowait(entry)
@@ -0,0 +1,195 @@
+import hashlib
+import struct
+import zlib
+from io import BytesIO
+
+# Marcadores SOF de JPEG (C4, C8 y CC no son SOF)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_COLOR_SPACES = {1: b"/DeviceGray", 3: b"/DeviceRGB", 4: b"/DeviceCMYK"}
+# Tipos de color PNG que PDF acepta tal cual (gris, RGB y paleta, sin alfa) y
+# sus profundidades admitidas; la de paleta se completa con el chunk PLTE
+_PNG_COLOR_SPACES = {
+    0: (b"/DeviceGray", 1, (1, 2, 4, 8)),
+    2: (b"/DeviceRGB", 3, (8,)),
+    3: (None, 1, (1, 2, 4, 8)),
+}
+
+
+def _num(value):
+    """Formatea un número para PDF sin decimales innecesarios."""
+    return f"{value:.4f}".rstrip("0").rstrip(".").encode()
+
+
+def _jpeg_image(data):
+    """Lee el tamaño de un JPEG de su cabecera SOF y lo incrusta sin recodificar."""
+    i = 2
+    while i + 9 < len(data):
+        if data[i + 1] == 0xFF:  # Relleno entre marcadores
+            i += 1
+            continue
+        if data[i + 1] in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[i + 5 : i + 9])
+            color_space = _JPEG_COLOR_SPACES[data[i + 9]]
+            return (
+                width,
+                height,
+                color_space + b" /BitsPerComponent 8 /Filter /DCTDecode",
+                data,
+            )
+        i += 2 + struct.unpack(">H", data[i + 2 : i + 4])[0]
+    raise ValueError("JPEG sin cabecera SOF.")
+
+
+def _png_image(data):
+    """Incrusta los datos IDAT de un PNG si PDF los admite; si no, lo recodifica.
+
+    Las paletas y las profundidades menores a 8 bits (habituales tras oxipng)
+    también se copian tal cual.
+    """
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack(
+        ">IIBBBBB", data[16:29]
+    )
+    color_space, colors, depths = _PNG_COLOR_SPACES.get(color_type, (None, 0, ()))
+    if bit_depth in depths and not interlace:
+        idat = []
+        i = 8
+        while i < len(data):
+            length, chunk_type = struct.unpack(">I4s", data[i : i + 8])
+            if chunk_type == b"IDAT":
+                idat.append(data[i + 8 : i + 8 + length])
+            elif chunk_type == b"PLTE":
+                palette = data[i + 8 : i + 8 + length]
+                color_space = b"[/Indexed /DeviceRGB %d <%s>]" % (
+                    len(palette) // 3 - 1,
+                    palette.hex().encode(),
+                )
+            i += 12 + length
+        params = b"<< /Predictor 15 /Colors %d /BitsPerComponent %d /Columns %d >>" % (
+            colors,
+            bit_depth,
+            width,
+        )
+        return (
+            width,
+            height,
+            color_space
+            + b" /BitsPerComponent %d /Filter /FlateDecode /DecodeParms " % bit_depth
+            + params,
+            b"".join(idat),
+        )
+
+    # Alfa, 16 bits o entrelazado: PDF no los admite directamente
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as im:
+        rgb = im.convert("RGB")
+    return (
+        width,
+        height,
+        b"/DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode",
+        zlib.compress(rgb.tobytes()),
+    )
+
+
+def prepare_image(data):
+    """Convierte un JPEG/PNG en (ancho, alto, parámetros, datos) para incrustarlo.
+
+    Es la parte costosa en CPU, separada de `PdfWriter.add_page` para poder
+    ejecutarla en otro hilo.
+    """
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_image(data)
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _png_image(data)
+    raise ValueError("Formato de imagen no soportado (se espera JPEG o PNG).")
+
+
+class PdfWriter:
+    """Escribe un PDF de una imagen por página directamente sobre un archivo.
+
+    Los JPEG y los PNG compatibles se copian byte a byte al PDF; cada página
+    se vuelca al archivo en cuanto se añade. Las imágenes repetidas (p. ej.
+    pasos cuyo efecto no cambia nada) se escriben una sola vez y las páginas
+    las referencian.
+    """
+
+    def __init__(self, fh):
+        self._fh = fh
+        self._offsets = {}
+        self._page_ids = []
+        self._image_ids = {}  # Digest de cabecera y datos -> id del XObject
+        self._content_ids = {}  # (ancho, alto) -> id del content stream
+        self._next_id = 3  # 1: catálogo, 2: árbol de páginas
+        fh.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _new_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self._offsets[obj_id] = self._fh.tell()
+        self._fh.write(b"%d 0 obj\n" % obj_id)
+        if stream is None:
+            self._fh.write(body)
+        else:
+            self._fh.write(body[:-2] + b" /Length %d >>\nstream\n" % len(stream))
+            self._fh.write(stream)
+            self._fh.write(b"\nendstream")
+        self._fh.write(b"\nendobj\n")
+
+    def add_page(self, image, width, height):
+        """Añade una página de `width`×`height` puntos ocupada por la imagen.
+
+        `image` es el resultado de `prepare_image`.
+        """
+        px_width, px_height, params, data = image
+        # El tamaño y los parámetros forman parte de la clave: los mismos bytes
+        # con otra cabecera son otra imagen
+        key = hashlib.blake2b(digest_size=16)
+        key.update(b"%d %d %s\n" % (px_width, px_height, params))
+        key.update(data)
+        digest = key.digest()
+        image_id = self._image_ids.get(digest)
+        if image_id is None:
+            image_id = self._image_ids[digest] = self._new_id()
+            self._write_object(
+                image_id,
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s >>"
+                % (px_width, px_height, params),
+                data,
+            )
+
+        width, height = _num(width), _num(height)
+        content_id = self._content_ids.get((width, height))
+        if content_id is None:
+            content_id = self._content_ids[(width, height)] = self._new_id()
+            self._write_object(
+                content_id, b"<< >>", b"q %s 0 0 %s 0 0 cm /Im0 Do Q" % (width, height)
+            )
+
+        page_id = self._new_id()
+        self._write_object(
+            page_id,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] "
+            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+            % (width, height, image_id, content_id),
+        )
+        self._page_ids.append(page_id)
+
+    def close(self):
+        """Escribe el árbol de páginas, el catálogo y la tabla xref."""
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids)
+        self._write_object(
+            2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_ids))
+        )
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self._fh.tell()
+        self._fh.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_id)
+        for obj_id in range(1, self._next_id):
+            self._fh.write(b"%010d 00000 n \n" % self._offsets[obj_id])
+        self._fh.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (self._next_id, xref_offset)
+        )